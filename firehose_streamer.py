@@ -23,45 +23,97 @@ Usage:
 Run the script to start processing messages from the firehose.
 """
 
+from atproto_client.models.dot_dict import DotDict
 from atproto_client.models.utils import get_or_create, get_model_as_json
-from atproto import CAR, AtUri, FirehoseSubscribeReposClient, firehose_models, models, parse_subscribe_repos_message
-import json
+from atproto import AsyncFirehoseSubscribeReposClient, firehose_models, models, parse_subscribe_repos_message
+import libipld
+import orjson
+import uvloop
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 import os
+import queue
 import sys
+import threading
+import time
 import logging
 
 
 def convert_to_json_serializable(obj):
-    """Convert model objects to JSON serializable format."""
+    """Convert model objects to JSON serializable Python objects."""
     if isinstance(obj, list):
         return [convert_to_json_serializable(item) for item in obj]
-    return get_model_as_json(obj)
+    if isinstance(obj, DotDict):
+        # Unknown record types may hold values JSON can't encode, so keep the encode check for them
+        return orjson.loads(get_model_as_json(obj))
+    return obj.model_dump(mode='json', exclude_none=True, by_alias=True)
+
+
+def _parse_iso(ts: str) -> float:
+    """
+    Convert an ISO-8601 commit time (e.g. '2024-07-01T12:00:00.123Z') to a UTC epoch timestamp.
+
+    Args:
+        ts (str): The timestamp string from the commit.
+    """
+    parsed = datetime.fromisoformat(ts)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+_WRITE_BATCH_SIZE = 256
+_write_queue = queue.Queue(maxsize=10000)
+_current_epoch_day = None
+_current_output_filename = None
+_current_output_file = None
+
+
+def _get_output_file(collected_at_datetime: datetime, collected_at: float):
+    """
+    Return the daily output filename and its open append handle, rolling over when the UTC day changes.
+
+    Args:
+        collected_at_datetime (datetime): The collection time.
+        collected_at (float): The collection time as an epoch timestamp.
+    """
+    global _current_epoch_day, _current_output_filename, _current_output_file
+    epoch_day = int(collected_at // 86400)
+    if epoch_day != _current_epoch_day:
+        if _current_output_file is not None:
+            _current_output_file.close()
+        _current_output_filename = f"{collected_at_datetime.strftime('%Y-%m-%d')}.json"
+        # Unbuffered so each commit lands as whole lines; restarts resume from the last line on disk
+        _current_output_file = open(_current_output_filename, "ab", buffering=0)
+        _current_epoch_day = epoch_day
+    return _current_output_filename, _current_output_file
 
 
 def _get_ops_by_type(commit: models.ComAtprotoSyncSubscribeRepos.Commit) -> dict:
     """
-    Process commit operations and save them to a JSON file.
+    Process commit operations and queue them for the writer thread to save to a JSON file.
 
     Args:
         commit (models.ComAtprotoSyncSubscribeRepos.Commit): The commit message to process.
     """
-    car = CAR.from_bytes(commit.blocks)
-    
-    input_date_format = "%Y-%m-%dT%H:%M:%S.%fZ"
-    output_date_format = "%Y-%m-%d"
+    # Only blocks referenced by an op are read, so skip CAR.from_bytes' per-block CID.decode and
+    # look records up by CID string in the raw decode; delete-only commits skip decoding entirely
+    blocks = {}
+    if any(op.cid for op in commit.ops):
+        _, blocks = libipld.decode_car(commit.blocks)
+
     collected_at_datetime = datetime.now(timezone.utc)
     collected_at = collected_at_datetime.timestamp()
-    collected_at_str = collected_at_datetime.strftime(input_date_format)
-    commit_datetime = datetime.strptime(commit.time, input_date_format)
-    commit_timestamp = commit_datetime.timestamp()
-    collect_date = collected_at_datetime.strftime(output_date_format)
-    output_filename = f"{collect_date}.json"
+    collected_at_str = collected_at_datetime.replace(tzinfo=None).isoformat(timespec='microseconds') + 'Z'
+    commit_timestamp = _parse_iso(commit.time)
+    buf = bytearray()
 
     # Process each operation in the commit
     for op in commit.ops:
+        # op.path is always '<collection>/<rkey>', so build the URI directly instead of parsing it with AtUri
+        uri = f'at://{commit.repo}/{op.path}'
         try:
-            uri = AtUri.from_str(f'at://{commit.repo}/{op.path}')
             commit_info = {
                 'seq': commit.seq,
                 'collected_at': collected_at,
@@ -69,31 +121,90 @@ def _get_ops_by_type(commit: models.ComAtprotoSyncSubscribeRepos.Commit) -> dict
                 'commit_time': commit_timestamp,
                 'commit_time_str': commit.time,
                 'action': op.action,
-                'type': uri.collection,
-                'uri': str(uri),
+                'type': op.path.split('/', 1)[0],
+                'uri': uri,
                 'author': commit.repo,
                 'cid': str(op.cid)
             }
 
             try:
-                record_json = None
-                record_raw_data = car.blocks.get(op.cid)
+                record = None
+                record_raw_data = blocks.get(str(op.cid))
                 record = get_or_create(record_raw_data, strict=False)
                 if record:
-                    record_json = convert_to_json_serializable(record)
-                    commit_info.update(json.loads(record_json))
+                    commit_info.update(convert_to_json_serializable(record))
             except Exception as e:
                 logger.error(f"Failed to update with info from blocks\nError: {e}\nRecord content not parsed: {record}\nCommit Info: {commit_info}")
             finally:
-                try:
-                    with open(output_filename, "at+", encoding='utf-8') as json_file:
-                        json_file.write(f'{json.dumps(commit_info)}\n')
-                except Exception as e:
-                    logger.critical(f"Failed to write to file: {output_filename} because of exception {e}")
-                    sys.exit(1)
+                buf += orjson.dumps(commit_info)
+                buf += b'\n'
         except Exception as e:
             logger.error(f"Failed to get basic info from: {op.cid}, {uri} because of exception: {e}")
 
+    if buf:
+        # Blocks only if the writer thread falls a full queue behind, rather than dropping commits
+        _write_queue.put((collected_at_datetime, collected_at, buf))
+
+
+def _writer_loop() -> None:
+    """
+    Drain serialized commits from the write queue and append them to the daily output file.
+
+    Each pass takes whatever is queued (up to _WRITE_BATCH_SIZE commits) and writes every run
+    of same-day commits with a single write. A None item stops the loop.
+    """
+    while True:
+        items = [_write_queue.get()]
+        while len(items) < _WRITE_BATCH_SIZE:
+            try:
+                items.append(_write_queue.get_nowait())
+            except queue.Empty:
+                break
+        stop = None in items
+        items = [item for item in items if item is not None]
+
+        output_filename = None
+        try:
+            json_file = None
+            batch = bytearray()
+            for collected_at_datetime, collected_at, buf in items:
+                # Write out the previous day's commits before the output file rolls over
+                if batch and int(collected_at // 86400) != _current_epoch_day:
+                    json_file.write(batch)
+                    batch.clear()
+                output_filename, json_file = _get_output_file(collected_at_datetime, collected_at)
+                batch += buf
+            if batch:
+                json_file.write(batch)
+        except Exception as e:
+            logger.critical(f"Failed to write to file: {output_filename} because of exception {e}")
+            # sys.exit would only end this thread
+            os._exit(1)
+        if stop:
+            return
+
+
+def _read_last_line(filename: str, block_size: int = 65536) -> bytes:
+    """
+    Read the last line of a file by reading fixed-size blocks backwards from the end.
+
+    Args:
+        filename (str): The file to read.
+        block_size (int): Number of bytes to read per step.
+    """
+    with open(filename, 'rb') as file:
+        end = file.seek(0, os.SEEK_END)
+        pos = end
+        tail = b''
+        while pos > 0:
+            pos = max(0, pos - block_size)
+            file.seek(pos)
+            tail = file.read(end - pos)
+            # A newline before the trailing one means the whole last line is in the tail
+            if tail.rstrip(b'\n').find(b'\n') != -1:
+                break
+        return tail.rstrip(b'\n').rsplit(b'\n', 1)[-1]
+
 
 if __name__ == '__main__':
     # Configure the logger
@@ -108,7 +219,7 @@ if __name__ == '__main__':
     logger = logging.getLogger('firehose_stream_logger')
     sys.stderr = open('streamer_stderr.log', 'a')
 
-    def on_message_handler(message: firehose_models.MessageFrame) -> None:
+    async def on_message_handler(message: firehose_models.MessageFrame) -> None:
         """
         Handle incoming messages from the firehose.
 
@@ -123,28 +234,57 @@ if __name__ == '__main__':
         # Update stored state every ~20 events
         if commit.seq % 20 == 0:
             client.update_params(models.ComAtprotoSyncSubscribeRepos.Params(cursor=commit.seq))
-            global last_seq
+            global last_seq, last_seq_flushed, last_seq_flush_time
             if not last_seq:
                 last_seq = commit.seq
             else:
                 last_seq = max(commit.seq, last_seq)
-                with open(last_seq_file, 'w+') as file:
-                    file.write(str(last_seq))
+                # Checkpoint to disk only every ~1000 events or 5 seconds, atomically via rename
+                now = time.monotonic()
+                if last_seq - last_seq_flushed >= 1000 or now - last_seq_flush_time > 5:
+                    with open(f"{last_seq_file}.tmp", 'w') as file:
+                        file.write(str(last_seq))
+                    os.replace(f"{last_seq_file}.tmp", last_seq_file)
+                    last_seq_flushed = last_seq
+                    last_seq_flush_time = now
 
-        _get_ops_by_type(commit)
+        # Decode and serialize off the event loop so frames keep being received; the single worker
+        # keeps commits in order and the semaphore bounds how far it may fall behind
+        await ops_slots.acquire()
+        future = asyncio.get_running_loop().run_in_executor(ops_executor, _get_ops_by_type, commit)
+        future.add_done_callback(on_ops_done)
 
-    def on_callback_error_handler(error: BaseException):
+    def on_ops_done(future: asyncio.Future) -> None:
+        """
+        Release the commit's slot and log any error raised while processing it.
+
+        Args:
+            future (asyncio.Future): The finished _get_ops_by_type call.
+        """
+        ops_slots.release()
+        if not future.cancelled() and future.exception():
+            logger.error(f"Failed to process commit because of exception: {future.exception()}")
+
+    async def on_callback_error_handler(error: BaseException):
         """
         Handle errors from the callback.
 
         Args:
             error (BaseException): The error encountered.
         """
-        logger.error('Got error!', error)
+        logger.error(f'Got error! {error}')
+
+    writer_thread = threading.Thread(target=_writer_loop, daemon=True)
+    writer_thread.start()
+
+    ops_executor = ThreadPoolExecutor(max_workers=1)
+    ops_slots = asyncio.Semaphore(1000)
 
-    client = FirehoseSubscribeReposClient(base_uri='wss://bsky.network/xrpc')
+    client = AsyncFirehoseSubscribeReposClient(base_uri='wss://bsky.network/xrpc')
     last_seq_file = "last_seq"
     last_seq = None
+    last_seq_flushed = 0
+    last_seq_flush_time = time.monotonic()
 
     try:
         json_files = [file for file in os.listdir() if file.endswith('.json')]
@@ -155,14 +295,7 @@ if __name__ == '__main__':
             # Sort the files by modification time and get the most recently modified file
             latest_json_file = max(json_files, key=lambda x: os.path.getmtime(x))
             # Get the last line of the latest modified file
-            with open(latest_json_file, 'r') as file:
-                # Seek to the end of the file
-                file.seek(0, os.SEEK_END)
-                file.seek(file.tell() - 2, os.SEEK_SET)
-                while file.read(1) != '\n':
-                    file.seek(file.tell() - 2, os.SEEK_SET)
-                last_line = file.readline()
-                last_line_json = json.loads(last_line)
+            last_line_json = orjson.loads(_read_last_line(latest_json_file))
 
             last_seq = int(last_line_json['seq'])
             client.update_params(models.ComAtprotoSyncSubscribeRepos.Params(cursor=last_seq))
@@ -174,6 +307,11 @@ if __name__ == '__main__':
                 logger.info(f"Streamer Started with file {last_seq_file} from seq: {last_seq}")
         else:
             logger.info("Streamer Started fresh")
-        client.start(on_message_handler, on_callback_error_handler)
+        uvloop.run(client.start(on_message_handler, on_callback_error_handler))
     except Exception as e:
         logger.critical(f"Streamer crashed because of error: {e}")
+    finally:
+        # Let the worker and then the writer drain whatever is still queued
+        ops_executor.shutdown(wait=True)
+        _write_queue.put(None)
+        writer_thread.join()